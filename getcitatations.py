@@ -6,22 +6,214 @@
 # 10.1021/acschemneuro.7b00193"
 # Output is a csv with columns: 
 # doi | crossref citation count | openalex citation count | dimensions citation count| max citations | processed at time
-# This script cleans links and gives search intervals to not reach API limits. 
+# | crossref/openalex/dimensions HTTP status
+# This script cleans links and rate limits requests per API host to not reach API limits. 
 # Be sure to import user agent email for ethical API usage.
 #
 # Script made with assistance of claude.ai
 
 import pandas as pd
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.util.request import ACCEPT_ENCODING
 import time
 import os
-from datetime import datetime
+import threading
+import sqlite3
+import functools
+from itertools import islice
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import logging
+import csv
+import re
+import hashlib
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:  # orjson is optional, fall back to the standard library parser
+    import json
+    json_loads = json.loads
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'Citation Analysis Tool (mailto:your-email@domain.com)'  # Replace with your email
+
+# (connect, read) timeouts in seconds; 3.05 sits just past the 3s TCP retransmission window
+REQUEST_TIMEOUT = (3.05, 10)
+
+def create_session():
+    """Create a pooled requests Session that retries transient API errors"""
+    retry = Retry(
+        total=3, connect=3, read=2, backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"]
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'User-Agent': USER_AGENT})
+    # Ask for compressed JSON; brotli is only advertised when urllib3 can decode it
+    session.headers['Accept-Encoding'] = 'br, gzip' if 'br' in ACCEPT_ENCODING.split(',') else 'gzip'
+    return session
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per `period` seconds"""
+    
+    def __init__(self, rate, period=1.0):
+        self.rate = rate / period
+        self.capacity = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a token is available, then consume it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+# Per-host request limits, kept a little under each API's documented cap
+HOST_LIMITS = {
+    'api.crossref.org': TokenBucket(40, 1),       # ~50 requests/second
+    'api.openalex.org': TokenBucket(8, 1),        # 10 requests/second
+    'metrics-api.dimensions.ai': TokenBucket(2, 1),  # varies, be conservative
+}
+
+def throttle(url):
+    """Wait for the rate limiter of the host serving `url`"""
+    HOST_LIMITS[urlparse(url).hostname].acquire()
+
+# Status recorded when a request got no HTTP response at all (timeout, connection error)
+STATUS_NO_RESPONSE = 0
+
+# One session per API host so each keeps its own connection pool alive between DOIs
+CROSSREF_SESSION = create_session()
+OPENALEX_SESSION = create_session()
+DIMENSIONS_SESSION = create_session()
+
+# Persistent (source, doi) -> (citation count, HTTP status) cache shared across runs
+CACHE_FILE = '.citation_cache.sqlite'
+# Seconds a cached result stays valid by HTTP status; missing DOIs are rechecked sooner
+CACHE_TTL = {200: 24 * 60 * 60, 404: 6 * 60 * 60}
+
+cache_lock = threading.Lock()
+cache_connection = None
+
+def get_cache_connection():
+    """Open the cache database on first use, creating its table if needed"""
+    global cache_connection
+    if cache_connection is None:
+        cache_connection = sqlite3.connect(CACHE_FILE, check_same_thread=False)
+        # WAL with NORMAL sync keeps commits off the fsync path; a crash loses at most recent cache rows
+        cache_connection.execute("PRAGMA journal_mode=WAL")
+        cache_connection.execute("PRAGMA synchronous=NORMAL")
+        cache_connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "source TEXT, doi TEXT, count INTEGER, fetched_at REAL, status INTEGER DEFAULT 200, "
+            "PRIMARY KEY (source, doi))"
+        )
+        # Caches created before statuses were tracked only hold successful lookups
+        columns = {row[1] for row in cache_connection.execute("PRAGMA table_info(cache)")}
+        if 'status' not in columns:
+            cache_connection.execute("ALTER TABLE cache ADD COLUMN status INTEGER DEFAULT 200")
+    return cache_connection
+
+def cache_lookup(source, doi):
+    """Return the cached (count, status) for a DOI, or None if missing or expired"""
+    try:
+        with cache_lock:
+            row = get_cache_connection().execute(
+                "SELECT count, status, fetched_at FROM cache WHERE source = ? AND doi = ?", (source, doi.lower())
+            ).fetchone()
+        if row and time.time() - row[2] < CACHE_TTL.get(row[1], 0):
+            return row[0], row[1]
+    except sqlite3.Error as e:
+        logger.warning(f"Cache lookup failed for {source} {doi}: {e}")
+    return None
+
+def cache_store_many(source, results):
+    """Save a dict of doi -> (count, status) in the cache in a single transaction"""
+    fetched_at = time.time()
+    rows = [(source, doi.lower(), count, status, fetched_at) for doi, (count, status) in results.items()]
+    try:
+        with cache_lock:
+            connection = get_cache_connection()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO cache (source, doi, count, status, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+    except sqlite3.Error as e:
+        logger.warning(f"Cache store failed for {len(rows)} {source} DOIs: {e}")
+
+def cache_store(source, doi, count, status):
+    """Save a citation count and the HTTP status it came with for a DOI in the cache"""
+    cache_store_many(source, {doi: (count, status)})
+
+def cached_citations(source):
+    """Decorator memoizing a per-DOI (count, status) lookup on disk, keyed by (source, doi)"""
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        def wrapper(doi, timeout=REQUEST_TIMEOUT):
+            cached = cache_lookup(source, doi)
+            if cached is not None:
+                return cached
+            count, status = fetch(doi, timeout=timeout)
+            # Failed lookups are not cached and are retried on the next run
+            if status in CACHE_TTL:
+                cache_store(source, doi, count, status)
+            return count, status
+        return wrapper
+    return decorator
+
+def cached_citations_batch(source):
+    """Decorator memoizing a batch (count, status) lookup on disk, only fetching uncached DOIs"""
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        def wrapper(dois, timeout=REQUEST_TIMEOUT):
+            results = {}
+            uncached = []
+            for doi in dois:
+                cached = cache_lookup(source, doi)
+                if cached is None:
+                    uncached.append(doi)
+                else:
+                    results[doi] = cached
+            if uncached:
+                fetched = fetch(uncached, timeout=timeout)
+                # Failed lookups are not cached and are retried on the next run
+                cache_store_many(source, {doi: result for doi, result in fetched.items() if result[1] in CACHE_TTL})
+                results.update(fetched)
+            return results
+        return wrapper
+    return decorator
+
+# DOI prefixes such as "doi:", "https://doi.org/" or "http://dx.doi.org/"
+DOI_PREFIX_RE = re.compile(r'^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)', re.IGNORECASE)
+
+def clean_dois(dois):
+    """Strip whitespace and DOI prefixes from a Series of DOIs, dropping empty and duplicate entries"""
+    dois = dois.dropna().astype(str).str.strip().str.replace(DOI_PREFIX_RE, '', regex=True)
+    # DOIs are case-insensitive, so normalize before de-duplicating (first occurrence wins)
+    dois = dois[dois.str.len() > 0].str.lower()
+    unique_dois = dois.drop_duplicates()
+    if len(unique_dois) < len(dois):
+        logger.info(f"Removed {len(dois) - len(unique_dois)} duplicate DOIs")
+    return unique_dois.tolist()
+
 def load_dois_from_file(filepath):
     """Load DOIs from a text file (one DOI per line) or CSV file"""
     try:
@@ -29,24 +221,15 @@ def load_dois_from_file(filepath):
             df = pd.read_csv(filepath)
             # Assume DOI column is named 'doi' or take the first column
             if 'doi' in df.columns:
-                dois = df['doi'].dropna().astype(str).tolist()
+                dois = df['doi']
             else:
-                dois = df.iloc[:, 0].dropna().astype(str).tolist()
+                dois = df.iloc[:, 0]
         else:
             # Text file - one DOI per line
             with open(filepath, 'r') as f:
-                dois = [line.strip() for line in f if line.strip()]
+                dois = pd.Series(f.read().splitlines())
         
-        # Clean DOIs - remove any prefixes like "doi:" or "https://doi.org/"
-        cleaned_dois = []
-        for doi in dois:
-            doi = doi.strip()
-            if doi.startswith('https://doi.org/'):
-                doi = doi.replace('https://doi.org/', '')
-            elif doi.startswith('doi:'):
-                doi = doi.replace('doi:', '')
-            if doi:  # Only add non-empty DOIs
-                cleaned_dois.append(doi)
+        cleaned_dois = clean_dois(dois)
         
         logger.info(f"Loaded {len(cleaned_dois)} DOIs from {filepath}")
         return cleaned_dois
@@ -54,157 +237,476 @@ def load_dois_from_file(filepath):
         logger.error(f"Error loading DOIs from {filepath}: {e}")
         return []
 
-def get_dimensions_citations(doi, timeout=10):
-    """Get citation count from Dimensions Metrics API"""
+@cached_citations('dimensions')
+def _get_dimensions_result(doi, timeout=REQUEST_TIMEOUT):
+    """Get (citation count, HTTP status) from Dimensions Metrics API"""
     try:
         # Dimensions Metrics API endpoint
         url = f"http://metrics-api.dimensions.ai/doi/{doi}"
         
-        response = requests.get(url, timeout=timeout)
+        throttle(url)
+        response = DIMENSIONS_SESSION.get(url, timeout=timeout)
         if response.status_code == 200:
-            data = response.json()
-            return data.get('times_cited', 0)
+            data = json_loads(response.content)
+            return data.get('times_cited', 0), 200
         elif response.status_code == 404:
-            return 0
+            return 0, 404
         else:
             logger.warning(f"Dimensions Metrics API error for {doi}: Status {response.status_code}")
-            return None
+            return None, response.status_code
     except Exception as e:
         logger.error(f"Dimensions error for {doi}: {e}")
-        return None
+        return None, STATUS_NO_RESPONSE
 
-def get_crossref_citations(doi, timeout=10):
-    """Get citation count from CrossRef"""
+@cached_citations('crossref')
+def _get_crossref_result(doi, timeout=REQUEST_TIMEOUT):
+    """Get (citation count, HTTP status) from CrossRef"""
     try:
         # CrossRef API endpoint
         url = f"https://api.crossref.org/works/{doi}"
-        headers = {
-            'User-Agent': 'Citation Analysis Tool (mailto:your-email@domain.com)'  # Replace with your email
-        }
         
-        response = requests.get(url, headers=headers, timeout=timeout)
+        throttle(url)
+        response = CROSSREF_SESSION.get(url, timeout=timeout)
         if response.status_code == 200:
-            data = response.json()
-            if 'message' in data:
-                return data['message'].get('is-referenced-by-count', 0)
+            data = json_loads(response.content)
+            return data.get('message', {}).get('is-referenced-by-count', 0), 200
         elif response.status_code == 404:
-            return 0
+            return 0, 404
         else:
             logger.warning(f"CrossRef API error for {doi}: Status {response.status_code}")
-            return None
-        return 0
+            return None, response.status_code
     except Exception as e:
         logger.error(f"CrossRef error for {doi}: {e}")
-        return None
+        return None, STATUS_NO_RESPONSE
 
-def get_openalex_citations(doi, timeout=10):
-    """Get citation count from OpenAlex"""
+@cached_citations('openalex')
+def _get_openalex_result(doi, timeout=REQUEST_TIMEOUT):
+    """Get (citation count, HTTP status) from OpenAlex"""
     try:
         # OpenAlex API endpoint
         url = f"https://api.openalex.org/works/doi:{doi}"
         
-        response = requests.get(url, timeout=timeout)
+        throttle(url)
+        response = OPENALEX_SESSION.get(url, timeout=timeout)
         if response.status_code == 200:
-            data = response.json()
-            return data.get('cited_by_count', 0)
+            data = json_loads(response.content)
+            return data.get('cited_by_count', 0), 200
         elif response.status_code == 404:
-            return 0
+            return 0, 404
         else:
             logger.warning(f"OpenAlex API error for {doi}: Status {response.status_code}")
-            return None
+            return None, response.status_code
     except Exception as e:
         logger.error(f"OpenAlex error for {doi}: {e}")
-        return None
+        return None, STATUS_NO_RESPONSE
+
+def get_dimensions_citations(doi, timeout=REQUEST_TIMEOUT):
+    """Get citation count from Dimensions Metrics API (0 if not found, None on error)"""
+    return _get_dimensions_result(doi, timeout=timeout)[0]
+
+def get_crossref_citations(doi, timeout=REQUEST_TIMEOUT):
+    """Get citation count from CrossRef (0 if not found, None on error)"""
+    return _get_crossref_result(doi, timeout=timeout)[0]
+
+def get_openalex_citations(doi, timeout=REQUEST_TIMEOUT):
+    """Get citation count from OpenAlex (0 if not found, None on error)"""
+    return _get_openalex_result(doi, timeout=timeout)[0]
+
+# Maximum number of DOIs per CrossRef/OpenAlex filter query
+BATCH_SIZE = 50
+
+def chunked(iterable, size):
+    """Yield successive lists of up to `size` items from an iterable"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def batchable(doi):
+    """Whether a DOI can be sent in a filter query (commas and pipes are filter separators)"""
+    return ',' not in doi and '|' not in doi
+
+# Errors meaning the host is throttling us or unreachable, after the session's own retries
+HOST_FAILURES = (requests.exceptions.RetryError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+def failed_batch(batch):
+    """Mark every DOI of a batch as failed, so it is retried on the next run instead of one DOI at a time now"""
+    return {doi: (None, STATUS_NO_RESPONSE) for doi in batch}
+
+def _query_crossref_filter(batch, timeout=REQUEST_TIMEOUT):
+    """Get (count, status) for up to BATCH_SIZE batchable DOIs from a single CrossRef filter query"""
+    try:
+        url = "https://api.crossref.org/works"
+        params = {
+            'filter': ','.join(f"doi:{doi}" for doi in batch),
+            'select': 'DOI,is-referenced-by-count',
+            'rows': BATCH_SIZE,
+            'cursor': '*',
+        }
+        requested = {doi.lower(): doi for doi in batch}
+        counts = {}
+        
+        while True:
+            throttle(url)
+            response = CROSSREF_SESSION.get(url, params=params, timeout=timeout)
+            if response.status_code == 429:
+                logger.warning(f"CrossRef batch rate limited for {len(batch)} DOIs, will retry on the next run")
+                return failed_batch(batch)
+            if response.status_code != 200:
+                logger.warning(f"CrossRef batch API error for {len(batch)} DOIs: Status {response.status_code}")
+                return {}
+            message = json_loads(response.content).get('message', {})
+            items = message.get('items', [])
+            for item in items:
+                doi = requested.get(item.get('DOI', '').lower())
+                if doi is not None:
+                    counts[doi] = item.get('is-referenced-by-count', 0)
+            if len(items) < BATCH_SIZE or len(counts) == len(batch) or not message.get('next-cursor'):
+                break
+            params['cursor'] = message['next-cursor']
+        
+        # DOIs absent from the filter results are not reported; the per-DOI lookup decides if they are missing
+        return {doi: (count, 200) for doi, count in counts.items()}
+    except HOST_FAILURES as e:
+        logger.error(f"CrossRef batch failed for {len(batch)} DOIs, will retry on the next run: {e}")
+        return failed_batch(batch)
+    except Exception as e:
+        logger.error(f"CrossRef batch error for {len(batch)} DOIs: {e}")
+        return {}
+
+def _query_openalex_filter(batch, timeout=REQUEST_TIMEOUT):
+    """Get (count, status) for up to BATCH_SIZE batchable DOIs from a single OpenAlex filter query"""
+    try:
+        url = "https://api.openalex.org/works"
+        params = {
+            'filter': 'doi:' + '|'.join(batch),
+            'select': 'doi,cited_by_count',
+            'per-page': BATCH_SIZE,
+            'cursor': '*',
+        }
+        requested = {doi.lower(): doi for doi in batch}
+        counts = {}
+        
+        while True:
+            throttle(url)
+            response = OPENALEX_SESSION.get(url, params=params, timeout=timeout)
+            if response.status_code == 429:
+                logger.warning(f"OpenAlex batch rate limited for {len(batch)} DOIs, will retry on the next run")
+                return failed_batch(batch)
+            if response.status_code != 200:
+                logger.warning(f"OpenAlex batch API error for {len(batch)} DOIs: Status {response.status_code}")
+                return {}
+            data = json_loads(response.content)
+            results = data.get('results', [])
+            for work in results:
+                # OpenAlex reports DOIs as https://doi.org/ URLs
+                doi = requested.get((work.get('doi') or '').lower().replace('https://doi.org/', ''))
+                if doi is not None:
+                    counts[doi] = work.get('cited_by_count', 0)
+            next_cursor = data.get('meta', {}).get('next_cursor')
+            if len(results) < BATCH_SIZE or len(counts) == len(batch) or not next_cursor:
+                break
+            params['cursor'] = next_cursor
+        
+        # DOIs absent from the filter results are not reported; the per-DOI lookup decides if they are missing
+        return {doi: (count, 200) for doi, count in counts.items()}
+    except HOST_FAILURES as e:
+        logger.error(f"OpenAlex batch failed for {len(batch)} DOIs, will retry on the next run: {e}")
+        return failed_batch(batch)
+    except Exception as e:
+        logger.error(f"OpenAlex batch error for {len(batch)} DOIs: {e}")
+        return {}
+
+def query_in_batches(query, dois, timeout=REQUEST_TIMEOUT):
+    """Run a filter query over the batchable DOIs BATCH_SIZE at a time and merge the results"""
+    results = {}
+    for chunk in chunked((doi for doi in dois if batchable(doi)), BATCH_SIZE):
+        results.update(query(chunk, timeout=timeout))
+    return results
+
+@cached_citations_batch('crossref')
+def _get_crossref_results_batch(dois, timeout=REQUEST_TIMEOUT):
+    """
+    Get citation counts from CrossRef filter queries of up to BATCH_SIZE DOIs each
+    
+    Returns a dict of doi -> (count, status) for the DOIs found, and
+    (None, STATUS_NO_RESPONSE) for DOIs whose query was rate limited or could
+    not reach the host. DOIs missing from the dict were not matched and
+    should be looked up individually.
+    """
+    return query_in_batches(_query_crossref_filter, dois, timeout)
+
+def get_crossref_citations_batch(dois, timeout=REQUEST_TIMEOUT):
+    """Get a dict of doi -> citation count from CrossRef filter queries, for the DOIs found"""
+    results = _get_crossref_results_batch(dois, timeout=timeout)
+    return {doi: count for doi, (count, _) in results.items() if count is not None}
+
+@cached_citations_batch('openalex')
+def _get_openalex_results_batch(dois, timeout=REQUEST_TIMEOUT):
+    """
+    Get citation counts from OpenAlex filter queries of up to BATCH_SIZE DOIs each
+    
+    Returns a dict of doi -> (count, status) for the DOIs found, and
+    (None, STATUS_NO_RESPONSE) for DOIs whose query was rate limited or could
+    not reach the host. DOIs missing from the dict were not matched and
+    should be looked up individually.
+    """
+    return query_in_batches(_query_openalex_filter, dois, timeout)
 
-def save_checkpoint(results, checkpoint_file):
-    """Save results to checkpoint file"""
+def get_openalex_citations_batch(dois, timeout=REQUEST_TIMEOUT):
+    """Get a dict of doi -> citation count from OpenAlex filter queries, for the DOIs found"""
+    results = _get_openalex_results_batch(dois, timeout=timeout)
+    return {doi: count for doi, (count, _) in results.items() if count is not None}
+
+CITATION_COLUMNS = ['crossref_citations', 'openalex_citations', 'dimensions_citations']
+# HTTP status behind each count: 200 found, 404 confirmed missing, anything else failed
+STATUS_COLUMNS = ['crossref_status', 'openalex_status', 'dimensions_status']
+CHECKPOINT_FIELDS = ['doi'] + CITATION_COLUMNS + ['processed_at_epoch'] + STATUS_COLUMNS
+# Explicit dtypes spare read_csv type inference and match the in-memory column buffers
+CHECKPOINT_DTYPES = {
+    'doi': str,
+    **{column: 'int32' for column in CITATION_COLUMNS},
+    'processed_at_epoch': 'float64',
+    **{column: 'int16' for column in STATUS_COLUMNS},
+}
+# Marks a failed lookup in the int32 count columns and the checkpoint file
+MISSING_COUNT = -1
+
+def allocate_columns(size):
+    """Pre-allocate one typed array per checkpoint field for `size` result rows"""
+    columns = {'doi': np.empty(size, dtype=object)}
+    for column in CITATION_COLUMNS:
+        columns[column] = np.full(size, MISSING_COUNT, dtype=np.int32)
+    columns['processed_at_epoch'] = np.empty(size, dtype=np.float64)
+    for column in STATUS_COLUMNS:
+        columns[column] = np.full(size, STATUS_NO_RESPONSE, dtype=np.int16)
+    return columns
+
+def store_result(columns, row_idx, result):
+    """Write one result row into the column buffers"""
+    for field, values in columns.items():
+        values[row_idx] = MISSING_COUNT if result[field] is None else result[field]
+
+def checkpoint_filename(doi_list):
+    """Checkpoint file name derived from the DOI list, so a rerun on the same input resumes it"""
+    digest = hashlib.sha1(','.join(sorted(doi_list)).encode()).hexdigest()[:12]
+    return f"citation_analysis_checkpoint_{digest}.csv"
+
+def open_checkpoint(checkpoint_file, append=True):
+    """Open checkpoint file for appending rows, writing the CSV header if the file is new"""
+    write_header = not append or not os.path.exists(checkpoint_file) or os.path.getsize(checkpoint_file) == 0
+    ends_with_newline = True
+    if not write_header:
+        # A hard kill can leave a partial last row; new rows must start on their own line
+        with open(checkpoint_file, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            ends_with_newline = f.read(1) in (b'\n', b'\r')
+    checkpoint_fh = open(checkpoint_file, 'a' if append else 'w', newline='')
+    writer = csv.writer(checkpoint_fh)
+    if not ends_with_newline:
+        checkpoint_fh.write('\r\n')
+    if write_header:
+        writer.writerow(CHECKPOINT_FIELDS)
+        checkpoint_fh.flush()
+    return checkpoint_fh, writer
+
+def save_checkpoint(columns, start, end, writer, checkpoint_fh):
+    """Append rows start:end of the column buffers to the checkpoint file"""
     try:
-        df = pd.DataFrame(results)
-        df.to_csv(checkpoint_file, index=False)
-        logger.info(f"Checkpoint saved: {len(results)} records")
+        writer.writerows(zip(*(columns[field][start:end].tolist() for field in CHECKPOINT_FIELDS)))
+        checkpoint_fh.flush()
+        logger.info(f"Checkpoint saved: {end - start} new records")
     except Exception as e:
         logger.error(f"Error saving checkpoint: {e}")
 
+def empty_checkpoint():
+    """Empty results DataFrame with the checkpoint fields and dtypes"""
+    return pd.DataFrame(columns=CHECKPOINT_FIELDS).astype(CHECKPOINT_DTYPES)
+
 def load_checkpoint(checkpoint_file):
-    """Load results from checkpoint file"""
+    """Load results from checkpoint file as a DataFrame, skipping rows that cannot be parsed"""
+    if not os.path.exists(checkpoint_file):
+        return empty_checkpoint()
     try:
-        if os.path.exists(checkpoint_file):
-            df = pd.read_csv(checkpoint_file)
-            results = df.to_dict('records')
-            logger.info(f"Checkpoint loaded: {len(results)} records")
-            return results
-        return []
+        df = pd.read_csv(checkpoint_file, dtype=str, on_bad_lines='skip')
+        missing_fields = [field for field in CHECKPOINT_FIELDS if field not in df.columns]
+        if missing_fields:
+            raise ValueError(f"missing columns {missing_fields}")
+        
+        # Rows cut off by an interrupted write have empty or non-numeric fields
+        numbers = df[CHECKPOINT_FIELDS[1:]].apply(pd.to_numeric, errors='coerce')
+        readable = df['doi'].notna() & numbers.notna().all(axis=1)
+        if not readable.all():
+            logger.warning(f"Skipped {(~readable).sum()} unreadable checkpoint rows")
+        df = pd.concat([df.loc[readable, ['doi']], numbers[readable]], axis=1).astype(CHECKPOINT_DTYPES)
+        
+        # DOIs retried by a resumed run appear more than once, the latest row wins
+        df = df.drop_duplicates('doi', keep='last').reset_index(drop=True)
+        logger.info(f"Checkpoint loaded: {len(df)} records")
+        return df
     except Exception as e:
-        logger.error(f"Error loading checkpoint: {e}")
-        return []
+        # Move the file aside, otherwise this run would append to it and every later resume fail the same way
+        unreadable_file = f"{checkpoint_file}.unreadable"
+        logger.error(f"Error loading checkpoint, moving it to {unreadable_file}: {e}")
+        try:
+            os.replace(checkpoint_file, unreadable_file)
+        except OSError as move_error:
+            logger.error(f"Could not move unreadable checkpoint: {move_error}")
+        return empty_checkpoint()
+
+def prefetch_batches(dois, provider_executor):
+    """Yield (doi, crossref_result, openalex_result), fetching CrossRef and OpenAlex BATCH_SIZE DOIs at a time"""
+    for chunk in chunked(dois, BATCH_SIZE):
+        crossref_future = provider_executor.submit(_get_crossref_results_batch, chunk)
+        openalex_future = provider_executor.submit(_get_openalex_results_batch, chunk)
+        crossref_results, openalex_results = crossref_future.result(), openalex_future.result()
+        for doi in chunk:
+            yield doi, crossref_results.get(doi), openalex_results.get(doi)
 
-def analyze_citations(doi_list, delay=2, checkpoint_interval=100, resume_from_checkpoint=True):
+def process_doi(doi, provider_executor, crossref_result=None, openalex_result=None):
+    """
+    Query the citation sources for a single DOI in parallel and return its result row
+    
+    CrossRef and OpenAlex are only queried when no prefetched (count, status)
+    is given, Dimensions has no batch endpoint and is always queried.
+    """
+    # The sources are independent, so query them at the same time
+    futures = {'dimensions': provider_executor.submit(_get_dimensions_result, doi)}
+    if crossref_result is None:
+        futures['crossref'] = provider_executor.submit(_get_crossref_result, doi)
+    if openalex_result is None:
+        futures['openalex'] = provider_executor.submit(_get_openalex_result, doi)
+    
+    dimensions_count, dimensions_status = futures['dimensions'].result()
+    crossref_count, crossref_status = futures['crossref'].result() if 'crossref' in futures else crossref_result
+    openalex_count, openalex_status = futures['openalex'].result() if 'openalex' in futures else openalex_result
+    
+    result = {
+        'doi': doi,
+        'crossref_citations': crossref_count,
+        'openalex_citations': openalex_count,
+        'dimensions_citations': dimensions_count,
+        'processed_at_epoch': time.time(),
+        'crossref_status': crossref_status,
+        'openalex_status': openalex_status,
+        'dimensions_status': dimensions_status,
+    }
+    return result
+
+def analyze_citations(doi_list, delay=None, checkpoint_interval=100, resume_from_checkpoint=True, max_workers=8, max_in_flight=16, checkpoint_file=None):
     """
     Analyze citations for a list of DOIs with rate limiting and checkpointing
     
     Parameters:
     - doi_list: List of DOIs to analyze
-    - delay: Delay between API calls (seconds) - recommended 2-3 seconds
+    - delay: Deprecated and ignored, requests are now throttled per API host (see HOST_LIMITS)
     - checkpoint_interval: Save progress every N DOIs
     - resume_from_checkpoint: Whether to resume from existing checkpoint
+    - max_workers: Number of DOIs processed concurrently
+    - max_in_flight: Maximum number of DOIs submitted but not yet collected
+    - checkpoint_file: Checkpoint path, defaults to one derived from doi_list
     """
     
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    checkpoint_file = f"citation_analysis_checkpoint_{timestamp}.csv"
+    if delay is not None:
+        logger.warning("analyze_citations: 'delay' is deprecated and ignored, requests are throttled per API host")
+    
+    if checkpoint_file is None:
+        checkpoint_file = checkpoint_filename(doi_list)
     
     # Load existing checkpoint if resuming
     if resume_from_checkpoint:
-        results = load_checkpoint(checkpoint_file)
-        processed_dois = {result['doi'] for result in results}
-        remaining_dois = [doi for doi in doi_list if doi not in processed_dois]
-        logger.info(f"Resuming: {len(processed_dois)} already processed, {len(remaining_dois)} remaining")
+        checkpoint_df = load_checkpoint(checkpoint_file)
+        # Only DOIs every source answered (found or confirmed missing) are done, failed lookups are retried
+        complete = checkpoint_df[STATUS_COLUMNS].isin([200, 404]).all(axis=1)
+        if not complete.all():
+            logger.info(f"Retrying {(~complete).sum()} DOIs with failed lookups")
+        checkpoint_df = checkpoint_df[complete]
+        processed_dois = set(checkpoint_df['doi'])
+        # Filtered lazily as the pipeline is topped up
+        remaining_dois = (doi for doi in doi_list if doi not in processed_dois)
+        remaining_count = len(doi_list) - len(processed_dois.intersection(doi_list))
+        logger.info(f"Resuming: {len(processed_dois)} already processed, {remaining_count} remaining")
     else:
-        results = []
+        checkpoint_df = empty_checkpoint()
         remaining_dois = doi_list
+        remaining_count = len(doi_list)
     
     total_dois = len(doi_list)
-    processed_count = len(results)
+    processed_count = len(checkpoint_df)
     
-    logger.info(f"Starting citation analysis for {len(remaining_dois)} DOIs...")
+    logger.info(f"Starting citation analysis for {remaining_count} DOIs...")
     
-    for i, doi in enumerate(remaining_dois, 1):
-        current_progress = processed_count + i
-        logger.info(f"Processing {current_progress}/{total_dois}: {doi}")
-        
-        # Get CrossRef citations (rate limit: ~50 requests per second)
-        crossref_count = get_crossref_citations(doi)
-        time.sleep(0.5)  # Small delay for CrossRef
-        
-        # Get OpenAlex citations (rate limit: 100,000 requests per day)
-        openalex_count = get_openalex_citations(doi)
-        time.sleep(0.5)  # Small delay for OpenAlex
-        
-        # Get Dimensions citations (rate limit: varies, be conservative)
-        dimensions_count = get_dimensions_citations(doi)
-        
-        # Store results
-        result = {
-            'doi': doi,
-            'crossref_citations': crossref_count,
-            'openalex_citations': openalex_count,
-            'dimensions_citations': dimensions_count,
-            'max_citations': max(filter(None, [crossref_count, openalex_count, dimensions_count])) if any([crossref_count, openalex_count, dimensions_count]) else 0,
-            'processed_at': datetime.now().isoformat()
-        }
-        results.append(result)
-        
-        # Save checkpoint periodically
-        if i % checkpoint_interval == 0:
-            save_checkpoint(results, checkpoint_file)
-        
-        # Rate limiting delay between DOIs
-        if i < len(remaining_dois):
-            time.sleep(delay)
+    # New rows are written straight into typed column buffers, i is the next free row
+    columns = allocate_columns(remaining_count)
+    i = 0
     
-    # Final save
-    save_checkpoint(results, checkpoint_file)
+    # Only rows past last_flushed_idx still need writing to the checkpoint file
+    checkpoint_fh, writer = open_checkpoint(checkpoint_file, append=resume_from_checkpoint)
+    last_flushed_idx = 0
     
-    return pd.DataFrame(results)
+    try:
+        # Provider calls get their own pool so DOI workers never wait on a slot they occupy
+        with ThreadPoolExecutor(max_workers=min(16, 3 * max_workers)) as provider_executor, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {}
+            # CrossRef and OpenAlex counts are prefetched in batches as the pipeline is topped up
+            doi_iter = prefetch_batches(remaining_dois, provider_executor)
+            
+            try:
+                while True:
+                    # Top up the pipeline; the bound keeps memory flat on large DOI lists
+                    for doi, crossref_result, openalex_result in doi_iter:
+                        future = executor.submit(process_doi, doi, provider_executor, crossref_result, openalex_result)
+                        in_flight[future] = doi
+                        if len(in_flight) >= max_in_flight:
+                            break
+                    if not in_flight:
+                        break
+                    
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        doi = in_flight.pop(future)
+                        store_result(columns, i, future.result())
+                        i += 1
+                        logger.info(f"Processed {processed_count + i}/{total_dois}: {doi}")
+                        
+                        # Save checkpoint periodically
+                        if i % checkpoint_interval == 0:
+                            save_checkpoint(columns, last_flushed_idx, i, writer, checkpoint_fh)
+                            last_flushed_idx = i
+            except BaseException:
+                # On Ctrl-C, drop queued DOIs and keep the rows of those already running
+                executor.shutdown(wait=False, cancel_futures=True)
+                provider_executor.shutdown(wait=False, cancel_futures=True)
+                for future in in_flight:
+                    if future.cancelled():
+                        continue
+                    try:
+                        store_result(columns, i, future.result())
+                        i += 1
+                    except Exception:
+                        pass  # its provider calls were cancelled
+                raise
+    finally:
+        # Final save, also reached when the run is interrupted
+        save_checkpoint(columns, last_flushed_idx, i, writer, checkpoint_fh)
+        checkpoint_fh.close()
+    
+    df = pd.DataFrame({field: values[:i] for field, values in columns.items()})
+    if len(checkpoint_df):
+        df = pd.concat([checkpoint_df, df], ignore_index=True)
+    # DOIs finish out of order, so put rows back in the order they were given
+    input_position = {doi: position for position, doi in enumerate(doi_list)}
+    df = df.sort_values('doi', key=lambda dois: dois.map(input_position), kind='stable').reset_index(drop=True)
+    # Nullable integers keep counts integral while marking failed lookups as missing
+    counts = df[CITATION_COLUMNS]
+    df[CITATION_COLUMNS] = counts.mask(counts == MISSING_COUNT).astype('Int64')
+    # Highest count across sources for all rows at once, skipping failed lookups
+    max_citations = df[CITATION_COLUMNS].max(axis=1, skipna=True).fillna(0).astype(int)
+    df.insert(df.columns.get_loc('processed_at_epoch'), 'max_citations', max_citations)
+    # Rows carry epoch seconds; convert the whole column to UTC timestamps in one go
+    processed_at = pd.to_datetime(df['processed_at_epoch'], unit='s', utc=True).dt.round('us')
+    df.insert(df.columns.get_loc('processed_at_epoch'), 'processed_at', processed_at)
+    return df.drop(columns='processed_at_epoch')
 
 def main():
     """Main function to run the citation analysis"""
@@ -232,7 +734,7 @@ def main():
     elif input_method == "2":
         # Manual entry
         doi_input = input("Enter DOIs (comma-separated): ").strip()
-        dois = [doi.strip() for doi in doi_input.split(",") if doi.strip()]
+        dois = clean_dois(pd.Series(doi_input.split(",")))
         
         if len(dois) > 6000:
             print(f"Warning: {len(dois)} DOIs entered. Truncating to first 6000.")
@@ -247,16 +749,19 @@ def main():
     
     print(f"\nFound {len(dois)} DOIs to process")
     
-    # Get delay setting
-    delay_input = input(f"Enter delay between API calls in seconds (default 2, recommended 2-3): ").strip()
-    delay = float(delay_input) if delay_input else 2.0
-    
     # Get checkpoint interval
     checkpoint_input = input(f"Enter checkpoint interval (save progress every N DOIs, default 100): ").strip()
     checkpoint_interval = int(checkpoint_input) if checkpoint_input else 100
     
+    # DOIs processed concurrently
+    max_workers = 8
+    
+    # Same DOI list -> same checkpoint file, so an interrupted run picks up where it left off
+    checkpoint_file = checkpoint_filename(dois)
+    
     # Confirm before starting
-    estimated_time = len(dois) * delay / 60  # rough estimate in minutes
+    # rough estimate in minutes, bounded by the slowest API's rate limit
+    estimated_time = len(dois) / HOST_LIMITS['metrics-api.dimensions.ai'].rate / 60
     print(f"\nEstimated time: {estimated_time:.1f} minutes")
     confirm = input("Start analysis? (y/n): ").strip().lower()
     
@@ -269,7 +774,7 @@ def main():
     start_time = time.time()
     
     try:
-        citation_df = analyze_citations(dois, delay=delay, checkpoint_interval=checkpoint_interval)
+        citation_df = analyze_citations(dois, checkpoint_interval=checkpoint_interval, max_workers=max_workers, checkpoint_file=checkpoint_file)
         
         # Display results
         print("\n" + "="*60)
@@ -285,9 +790,9 @@ def main():
         print("SUMMARY STATISTICS")
         print("="*60)
         print(f"Total DOIs processed: {len(citation_df)}")
-        print(f"CrossRef mean citations: {citation_df['crossref_citations'].mean():.2f}")
-        print(f"OpenAlex mean citations: {citation_df['openalex_citations'].mean():.2f}")
-        print(f"Dimensions mean citations: {citation_df['dimensions_citations'].mean():.2f}")
+        print(f"CrossRef mean citations: {citation_df['crossref_citations'].astype(float).mean():.2f}")
+        print(f"OpenAlex mean citations: {citation_df['openalex_citations'].astype(float).mean():.2f}")
+        print(f"Dimensions mean citations: {citation_df['dimensions_citations'].astype(float).mean():.2f}")
         
         # Export final results
         output_filename = f"citation_analysis_final_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv"
@@ -298,7 +803,7 @@ def main():
         print(f"Results saved to: {output_filename}")
         
     except KeyboardInterrupt:
-        print("\nAnalysis interrupted by user. Progress has been saved to checkpoint file.")
+        print(f"\nAnalysis interrupted by user. Progress has been saved to {checkpoint_file}, rerun with the same DOIs to resume.")
     except Exception as e:
         logger.error(f"Analysis failed: {e}")
         print(f"Analysis failed: {e}")